@@ -13,3 +13,6 @@ CREATE TABLE IF NOT EXISTS Applications (
     is_resolved BOOLEAN NOT NULL DEFAULT FALSE,
     language VARCHAR(255) NOT NULL DEFAULT 'EN'
 );
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_apps_chat_id_number ON Applications(chat_id, application_number);
+CREATE INDEX IF NOT EXISTS idx_apps_needing_update ON Applications(last_updated) WHERE is_resolved = FALSE;
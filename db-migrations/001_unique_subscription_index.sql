@@ -0,0 +1,12 @@
+-- Adds the unique (chat_id, application_number) index that add_to_db() relies on for ON CONFLICT.
+-- Databases created from db-init-scripts/init.sql already have it.
+-- The index cannot be built while duplicate subscriptions exist, so the oldest row (lowest id)
+-- of each duplicate group is kept and the rest are deleted. Back up the database first.
+BEGIN;
+
+DELETE FROM Applications a USING Applications b
+WHERE a.chat_id = b.chat_id AND a.application_number = b.application_number AND a.id > b.id;
+
+CREATE UNIQUE INDEX IF NOT EXISTS idx_apps_chat_id_number ON Applications(chat_id, application_number);
+
+COMMIT;
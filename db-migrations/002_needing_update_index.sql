@@ -0,0 +1,3 @@
+-- Adds the partial index behind the scheduler query in get_applications_needing_update().
+-- Databases created from db-init-scripts/init.sql already have it.
+CREATE INDEX IF NOT EXISTS idx_apps_needing_update ON Applications(last_updated) WHERE is_resolved = FALSE;
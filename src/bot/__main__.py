@@ -3,8 +3,9 @@ from telegram.error import NetworkError
 import asyncio
 import logging
 import signal
+import uvloop
 
-from bot.loader import loop, bot, db, rabbit, LOG_LEVEL
+from bot.loader import bot, db, rabbit, LOG_LEVEL
 from bot.handlers import start_command, help_command, unknown, status_command
 from bot.handlers import unsubscribe_command, subscribe_command, admin_stats_command
 from bot.handlers import force_refresh_command, subscribe_button, lang_command, set_language_startup, set_language_cmd
@@ -121,4 +122,4 @@ async def main():
 
 
 if __name__ == "__main__":
-    loop.run_until_complete(main())
+    uvloop.run(main())
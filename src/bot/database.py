@@ -1,26 +1,67 @@
 import asyncpg
 import logging
-import pytz
 import asyncio
+import time
+from collections import OrderedDict
 from bot.texts import message_texts
 
 MAX_RETRIES = 5  # maximum number of connection retries
 RETRY_DELAY = 2  # delay (in seconds) between retries
+POOL_MIN_SIZE = 5  # connections opened on startup
+POOL_MAX_SIZE = 20  # upper bound of pooled connections
+
+# Read-only queries issued on every command, prepared on each new pooled connection
+QUERY_CHECK_SUBSCRIPTION = "SELECT 1 FROM Applications WHERE chat_id = $1 LIMIT 1"
+QUERY_GET_LANGUAGE = "SELECT language FROM Applications WHERE chat_id = $1"
+WARM_UP_QUERIES = (QUERY_CHECK_SUBSCRIPTION, QUERY_GET_LANGUAGE)
+WARM_UP_CHAT_ID = 0  # telegram never issues chat_id 0, so warm-up queries match no rows
+# Sent with the connection startup packet, so no extra round-trip per connection.
+# JIT compilation only adds startup overhead to the short OLTP queries used here.
+SERVER_SETTINGS = {"jit": "off", "application_name": "mvcr-bot"}
+CURSOR_PREFETCH = 200  # rows fetched per cursor round-trip when streaming large result sets
+# Required by add_to_db() ON CONFLICT, created by init.sql or db-migrations/001_unique_subscription_index.sql
+SUBSCRIPTION_INDEX = "idx_apps_chat_id_number"
+# Backs the scheduler query, created by init.sql or db-migrations/002_needing_update_index.sql
+NEEDING_UPDATE_INDEX = "idx_apps_needing_update"
+LANG_CACHE_TTL = 300  # seconds a cached user language stays valid
+LANG_CACHE_MAX_SIZE = 10000  # least recently used entries are evicted above this size
 
 logger = logging.getLogger(__name__)
 
 
 class Database:
-    def __init__(self, dbname, user, password, host, port, loop):
+    def __init__(
+        self,
+        dbname,
+        user,
+        password,
+        host,
+        port,
+        pool_min=POOL_MIN_SIZE,
+        pool_max=POOL_MAX_SIZE,
+        command_timeout=None,
+        max_inactive_connection_lifetime=None,
+    ):
+        # asyncpg would reject these in create_pool, where connect() retries them as connection failures
+        if pool_max < 1 or not 0 <= pool_min <= pool_max:
+            raise ValueError(f"Invalid DB pool size: min={pool_min}, max={pool_max}, expected 0 <= min <= max and max >= 1")
         self.dbname = dbname
         self.user = user
         self.password = password
         self.host = host
         self.port = port
-        self.loop = loop
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self.command_timeout = command_timeout
+        self.max_inactive_connection_lifetime = max_inactive_connection_lifetime
         self.pool = None
+        self._lang_cache = OrderedDict()  # chat_id -> (language, monotonic timestamp)
 
     async def connect(self, max_retries=MAX_RETRIES, delay=RETRY_DELAY):
+        # asyncpg applies its own default when the lifetime isn't configured
+        pool_options = {}
+        if self.max_inactive_connection_lifetime is not None:
+            pool_options["max_inactive_connection_lifetime"] = self.max_inactive_connection_lifetime
         for attempt in range(1, max_retries + 1):
             try:
                 self.pool = await asyncpg.create_pool(
@@ -29,19 +70,65 @@ class Database:
                     password=self.password,
                     host=self.host,
                     port=self.port,
-                    min_size=5,
-                    max_size=20,
+                    min_size=self.pool_min,
+                    max_size=self.pool_max,
+                    command_timeout=self.command_timeout,
+                    server_settings=SERVER_SETTINGS,
+                    init=self._init_connection,
+                    **pool_options,
                 )
                 logger.info("Connected to the DB")
                 break
             except Exception as e:
-                logger.error(f"Failed to connect to the database. Attempt {attempt}/{max_retries}. Error: {e}")
+                logger.error("Failed to connect to the database. Attempt %s/%s. Error: %s", attempt, max_retries, e)
                 if attempt < max_retries:
                     await asyncio.sleep(delay)
                     delay *= 2  # Double the delay for next retry
                 else:
                     logger.error("Max retries reached. Unable to connect to the database")
                     raise
+        await self._check_schema()
+
+    async def _check_schema(self):
+        """Fail fast if the database predates the indexes the queries rely on"""
+        if await self.pool.fetchval("SELECT to_regclass($1)", SUBSCRIPTION_INDEX) is None:
+            logger.error(
+                "Index %s is missing. Apply db-migrations/001_unique_subscription_index.sql, see docs/development.md",
+                SUBSCRIPTION_INDEX,
+            )
+            raise RuntimeError(f"Database schema is outdated: missing index {SUBSCRIPTION_INDEX}")
+        if await self.pool.fetchval("SELECT to_regclass($1)", NEEDING_UPDATE_INDEX) is None:
+            logger.warning(
+                "Index %s is missing, scheduler queries will scan the whole table. "
+                "Apply db-migrations/002_needing_update_index.sql, see docs/development.md",
+                NEEDING_UPDATE_INDEX,
+            )
+
+    async def _init_connection(self, conn):
+        """Run per-command queries once on a new connection so they land in its statement cache"""
+        # conn.prepare() bypasses the statement cache, hence the dummy executions
+        try:
+            for query in WARM_UP_QUERIES:
+                await conn.fetchval(query, WARM_UP_CHAT_ID)
+        except Exception as e:
+            logger.warning("Failed to prepare statements. Error: %s", e)
+
+    def _cache_language(self, chat_id, lang):
+        self._lang_cache[chat_id] = (lang, time.monotonic())
+        self._lang_cache.move_to_end(chat_id)
+        if len(self._lang_cache) > LANG_CACHE_MAX_SIZE:
+            self._lang_cache.popitem(last=False)
+
+    def _get_cached_language(self, chat_id):
+        cached = self._lang_cache.get(chat_id)
+        if cached is None:
+            return None
+        lang, cached_at = cached
+        if time.monotonic() - cached_at >= LANG_CACHE_TTL:
+            del self._lang_cache[chat_id]
+            return None
+        self._lang_cache.move_to_end(chat_id)
+        return lang
 
     async def add_to_db(
         self,
@@ -55,12 +142,13 @@ class Database:
         last_name=None,
         lang="EN",
     ):
-        logger.info(f"Adding chatID {chat_id} with application number {application_number} to DB")
+        logger.info("Adding chatID %s with application number %s to DB", chat_id, application_number)
         query = (
             "INSERT INTO Applications "
             "(chat_id, application_number, application_suffix, application_type, application_year, current_status, "
             "username, first_name, last_name, language) "
-            "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10)"
+            "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10) "
+            "ON CONFLICT (chat_id, application_number) DO NOTHING"
         )
         params = (
             chat_id,
@@ -74,168 +162,169 @@ class Database:
             last_name,
             lang,
         )
-        async with self.pool.acquire() as conn:
-            try:
-                await conn.execute(query, *params)
-                return True
-            except asyncpg.UniqueViolationError:
-                logger.error(f"Attempt to insert duplicate chat ID {chat_id} and application number {application_number}")
-                return False
-            except Exception as e:
-                logger.error(
-                    f"Error while inserting into DB for chat ID: {chat_id} "
-                    f"for application number {application_number}. Error: {e}"
-                )
+        try:
+            status = await self.pool.execute(query, *params)
+            if status.endswith(" 0"):
+                logger.error("Attempt to insert duplicate chat ID %s and application number %s", chat_id, application_number)
                 return False
+            self._cache_language(chat_id, lang)
+            return True
+        except Exception as e:
+            logger.error(
+                "Error while inserting into DB for chat ID: %s for application number %s. Error: %s",
+                chat_id,
+                application_number,
+                e,
+            )
+            return False
 
     async def update_db_status(self, chat_id, current_status, is_resolved):
-        logger.info(f"Updating chatID {chat_id} current status in DB")
+        logger.info("Updating chatID %s current status in DB", chat_id)
         query = "UPDATE Applications SET current_status = $1, last_updated = CURRENT_TIMESTAMP, is_resolved=$2 WHERE chat_id = $3"
         params = (current_status, is_resolved, chat_id)
-        async with self.pool.acquire() as conn:
-            try:
-                await conn.execute(query, *params)
-                return True
-            except Exception as e:
-                logger.error(f"Error while updating DB for chat ID: {chat_id}. Error: {e}")
-                return False
+        try:
+            await self.pool.execute(query, *params)
+            return True
+        except Exception as e:
+            logger.error("Error while updating DB for chat ID: %s. Error: %s", chat_id, e)
+            return False
 
     async def remove_from_db(self, chat_id):
-        logger.info(f"Removing chatID {chat_id} from DB")
+        logger.info("Removing chatID %s from DB", chat_id)
         query = "DELETE FROM Applications WHERE chat_id = $1"
-        async with self.pool.acquire() as conn:
-            try:
-                await conn.execute(query, chat_id)
-                return True
-            except Exception as e:
-                logger.error(f"Error while updating DB for chat ID: {chat_id}. Error: {e}")
-                return False
+        try:
+            await self.pool.execute(query, chat_id)
+            self._lang_cache.pop(chat_id, None)
+            return True
+        except Exception as e:
+            logger.error("Error while updating DB for chat ID: %s. Error: %s", chat_id, e)
+            return False
 
     async def get_user_data_from_db(self, chat_id):
-        """Fetch all user data for a given chat_id."""
+        """Fetch all user data for a given chat_id as an asyncpg.Record."""
         query = """
             SELECT * FROM Applications WHERE chat_id = $1;
         """
-        async with self.pool.acquire() as conn:
-            try:
-                row = await conn.fetchrow(query, chat_id)
-                if row is None:
-                    logger.info(f"No data found for chat_id {chat_id}")
-                    return None
-                return dict(row)  # Convert the record to a dictionary
-            except Exception as e:
-                logger.error(f"Error while fetching user data for chat ID: {chat_id}. Error: {e}")
+        try:
+            row = await self.pool.fetchrow(query, chat_id)
+            if row is None:
+                logger.info("No data found for chat_id %s", chat_id)
                 return None
+            return row  # asyncpg.Record supports row["column"] access without copying
+        except Exception as e:
+            logger.error("Error while fetching user data for chat ID: %s. Error: %s", chat_id, e)
+            return None
 
-    async def get_application_status(self, chat_id):
-        query = "SELECT current_status FROM Applications WHERE chat_id = $1;"
-        async with self.pool.acquire() as conn:
-            try:
-                result = await conn.fetchval(query, chat_id)
-                return result
-            except Exception as e:
-                logger.error(f"Error while fetching application status for chat ID: {chat_id}. Error: {e}")
-                return None
+    async def touch_and_get_status(self, chat_id):
+        """Bump last_updated and return current status in a single round-trip"""
+        query = "UPDATE Applications SET last_updated = CURRENT_TIMESTAMP WHERE chat_id = $1 RETURNING current_status"
+        try:
+            return await self.pool.fetchval(query, chat_id)
+        except Exception as e:
+            logger.error("Error while refreshing application status for chat ID: %s. Error: %s", chat_id, e)
+            return None
 
     async def get_application_status_timestamp(self, chat_id, lang="EN"):
-        query = "SELECT current_status, last_updated FROM Applications WHERE chat_id = $1;"
-        async with self.pool.acquire() as conn:
-            try:
-                result = await conn.fetchrow(query, chat_id)
-                if result is not None and result["last_updated"]:
-                    current_status = result["current_status"]
-                    last_updated_utc = result["last_updated"].replace(tzinfo=pytz.utc)
-                    last_updated_prague = last_updated_utc.astimezone(pytz.timezone("Europe/Prague"))
-                    timestamp = last_updated_prague.strftime("%H:%M:%S %d-%m-%Y")
-
-                    status_str = message_texts[lang]["current_status_timestamp"].format(
-                        status=current_status,
-                        timestamp=timestamp,
-                    )
-                    return status_str
-                else:
-                    return message_texts[lang]["current_status_empty"]
-            except Exception as e:
-                logger.error(f"Error while fetching status from DB for chat ID: {chat_id}. Error: {e}")
-                return message_texts[lang]["error_generic"]
+        # last_updated is stored in UTC, let postgres convert and format it for Prague
+        query = (
+            "SELECT current_status, "
+            "to_char(last_updated AT TIME ZONE 'UTC' AT TIME ZONE 'Europe/Prague', 'HH24:MI:SS DD-MM-YYYY') AS ts "
+            "FROM Applications WHERE chat_id = $1"
+        )
+        try:
+            result = await self.pool.fetchrow(query, chat_id)
+            if result is not None and result["ts"]:
+                status_str = message_texts[lang]["current_status_timestamp"].format(
+                    status=result["current_status"],
+                    timestamp=result["ts"],
+                )
+                return status_str
+            else:
+                return message_texts[lang]["current_status_empty"]
+        except Exception as e:
+            logger.error("Error while fetching status from DB for chat ID: %s. Error: %s", chat_id, e)
+            return message_texts[lang]["error_generic"]
 
     async def check_subscription_in_db(self, chat_id):
-        query = "SELECT EXISTS(SELECT chat_id FROM Applications WHERE chat_id=$1)"
-        async with self.pool.acquire() as conn:
-            try:
-                result = await conn.fetchval(query, chat_id)
-                return result
-            except Exception as e:
-                logger.error(f"Error while checking chat_id {chat_id} subscription. Error: {e}")
-                return False
+        try:
+            result = await self.pool.fetchval(QUERY_CHECK_SUBSCRIPTION, chat_id)
+            return bool(result)
+        except Exception as e:
+            logger.error("Error while checking chat_id %s subscription. Error: %s", chat_id, e)
+            return False
 
     async def get_applications_needing_update(self, refresh_period):
-        # Convert the timedelta refresh period to seconds for the SQL interval.
-        seconds = refresh_period.total_seconds()
+        """Yield applications due for a status refresh, streamed with a server-side cursor
 
-        # Fetch rows where the current time minus last_checked is more than the refresh period.
+        The cursor holds a pooled connection and an open transaction until the caller has
+        consumed every record, including any work it does between records.
+        """
+        # Compare last_updated against a constant cutoff so idx_apps_needing_update can be used.
+        # LOCALTIMESTAMP matches how CURRENT_TIMESTAMP is stored in the last_updated column.
         query = """
             SELECT chat_id, application_number, application_suffix, application_type, application_year, last_updated
             FROM Applications
-            WHERE EXTRACT(EPOCH FROM (CURRENT_TIMESTAMP - COALESCE(last_updated, TIMESTAMP '1970-01-01'))) > $1
+            WHERE (last_updated IS NULL OR last_updated < LOCALTIMESTAMP - $1::interval)
             AND is_resolved = FALSE
         """
 
-        async with self.pool.acquire() as conn:
-            try:
-                return await conn.fetch(query, seconds)
-            except Exception as e:
-                logger.error(f"Error while fetching applications needing update. Error: {e}")
-                return []
-
-    async def update_timestamp(self, chat_id):
-        logger.info(f"Updating last_updated timestamp for chatID {chat_id} in DB")
-        query = "UPDATE Applications SET last_updated = CURRENT_TIMESTAMP WHERE chat_id = $1"
-        async with self.pool.acquire() as conn:
-            try:
-                await conn.execute(query, chat_id)
-            except Exception as e:
-                logger.error(f"Error while updating timestamp for chat ID: {chat_id}. Error: {e}")
+        yielded = 0
+        try:
+            async with self.pool.acquire() as conn, conn.transaction():
+                async for record in conn.cursor(query, refresh_period, prefetch=CURSOR_PREFETCH):
+                    yield record
+                    yielded += 1
+        except Exception as e:
+            if yielded:
+                logger.error(
+                    "Fetching applications needing update was cut short after %s row(s), "
+                    "the rest are left for the next run. Error: %s",
+                    yielded,
+                    e,
+                )
+            else:
+                logger.error("Error while fetching applications needing update. Error: %s", e)
 
     async def get_subscribed_user_count(self):
         """Return the count of unique users subscribed"""
         query = "SELECT COUNT(DISTINCT chat_id) FROM Applications;"
-        async with self.pool.acquire() as conn:
-            try:
-                count = await conn.fetchval(query)
-                return count
-            except Exception as e:
-                logger.error(f"Error while fetching subscribed user count. Error: {e}")
-                return None
+        try:
+            count = await self.pool.fetchval(query)
+            return count
+        except Exception as e:
+            logger.error("Error while fetching subscribed user count. Error: %s", e)
+            return None
 
     async def get_user_language(self, chat_id):
-        query = "SELECT language FROM Applications WHERE chat_id = $1;"
-        async with self.pool.acquire() as conn:
-            # (olegeech) tmp to see how often we need DB to fetch language for each command
-            logger.info(f"Going to DB to fetch language for user: {chat_id}")
-            try:
-                result = await conn.fetchval(query, chat_id)
-                return result
-            except Exception as e:
-                logger.error(f"Error while fetching language for chat ID: {chat_id}. Error: {e}")
-                return None
+        cached_lang = self._get_cached_language(chat_id)
+        if cached_lang is not None:
+            return cached_lang
+        # (olegeech) tmp to see how often we need DB to fetch language for each command
+        logger.info("Going to DB to fetch language for user: %s", chat_id)
+        try:
+            result = await self.pool.fetchval(QUERY_GET_LANGUAGE, chat_id)
+            if result is not None:
+                self._cache_language(chat_id, result)
+            return result
+        except Exception as e:
+            logger.error("Error while fetching language for chat ID: %s. Error: %s", chat_id, e)
+            return None
 
     async def set_user_language(self, chat_id, lang):
-        logger.info(f"Updating chatID {chat_id} current status in DB")
         query = "UPDATE Applications SET language = $1 WHERE chat_id = $2"
         params = (lang, chat_id)
-        logger.info(f"Update user {chat_id} language in DB to {lang}")
-        async with self.pool.acquire() as conn:
-            try:
-                await conn.execute(query, *params)
-                return True
-            except Exception as e:
-                logger.error(f"Error while updating lang in DB for chat ID: {chat_id}. Error: {e}")
-                return False
+        logger.info("Update user %s language in DB to %s", chat_id, lang)
+        try:
+            await self.pool.execute(query, *params)
+            self._cache_language(chat_id, lang)
+            return True
+        except Exception as e:
+            logger.error("Error while updating lang in DB for chat ID: %s. Error: %s", chat_id, e)
+            return False
 
     async def close(self):
         logger.info("Shutting down DB connection")
         try:
             await self.pool.close()
         except Exception as e:
-            logger.error(f"Error while shutting down DB connection. Error: {e}")
+            logger.error("Error while shutting down DB connection. Error: %s", e)
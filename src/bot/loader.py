@@ -1,5 +1,3 @@
-import asyncio
-import uvloop
 import os
 from telegram.ext import Application, Defaults
 from telegram.constants import ParseMode
@@ -16,6 +14,11 @@ DB_USER = os.getenv("DB_USER", "postgres")
 DB_PASSWORD = os.getenv("DB_PASSWORD", "postgres")
 DB_HOST = os.getenv("DB_HOST", "localhost")
 DB_PORT = os.getenv("DB_PORT", 5432)
+DB_POOL_MIN = int(os.getenv("DB_POOL_MIN", database.POOL_MIN_SIZE))
+DB_POOL_MAX = int(os.getenv("DB_POOL_MAX", database.POOL_MAX_SIZE))
+DB_COMMAND_TIMEOUT = float(os.getenv("DB_COMMAND_TIMEOUT", 0)) or None
+DB_POOL_MAX_INACTIVE_LIFETIME = os.getenv("DB_POOL_MAX_INACTIVE_LIFETIME")
+DB_POOL_MAX_INACTIVE_LIFETIME = float(DB_POOL_MAX_INACTIVE_LIFETIME) if DB_POOL_MAX_INACTIVE_LIFETIME else None
 # Rabbit config
 RABBIT_HOST = os.getenv("RABBIT_HOST", "localhost")
 RABBIT_USER = os.getenv("RABBIT_USER", "bunny_admin")
@@ -24,8 +27,6 @@ RABBIT_PASSWORD = os.getenv("RABBIT_PASSWORD", "password")
 REFRESH_PERIOD = int(os.getenv("REFRESH_PERIOD", 3600))
 SCHEDULER_PERIOD = int(os.getenv("SCHEDULER_PERIOD", 300))
 
-asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
-loop = asyncio.get_event_loop()
 defaults = Defaults(parse_mode=ParseMode.HTML)
 
 # Init bot, db and rabbit
@@ -36,7 +37,10 @@ db = database.Database(
     password=DB_PASSWORD,
     host=DB_HOST,
     port=DB_PORT,
-    loop=loop,
+    pool_min=DB_POOL_MIN,
+    pool_max=DB_POOL_MAX,
+    command_timeout=DB_COMMAND_TIMEOUT,
+    max_inactive_connection_lifetime=DB_POOL_MAX_INACTIVE_LIFETIME,
 )
 rabbit = rabbitmq.RabbitMQ(
     host=RABBIT_HOST,
@@ -44,5 +48,4 @@ rabbit = rabbitmq.RabbitMQ(
     password=RABBIT_PASSWORD,
     bot=bot,
     db=db,
-    loop=loop,
 )
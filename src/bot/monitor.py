@@ -1,5 +1,6 @@
 import asyncio
 import logging
+from contextlib import aclosing
 from datetime import timedelta
 from bot.loader import REFRESH_PERIOD, SCHEDULER_PERIOD
 
@@ -26,24 +27,33 @@ class ApplicationMonitor:
                 pass
 
     async def check_for_updates(self):
-        applications_to_update = await self.db.get_applications_needing_update(self.refresh)
-
-        if not applications_to_update:
+        scheduled_count = 0
+
+        # The cursor keeps a DB connection and transaction open for the whole loop, publishes included.
+        # aclosing releases them even if publishing fails midway
+        async with aclosing(self.db.get_applications_needing_update(self.refresh)) as applications:
+            async for app in applications:
+                scheduled_count += 1
+                message = {
+                    "chat_id": app["chat_id"],
+                    "number": app["application_number"],
+                    "suffix": app["application_suffix"],
+                    "type": app["application_type"],
+                    "year": app["application_year"],
+                    "last_updated": app["last_updated"].isoformat() if app["last_updated"] else "0",
+                }
+                logger.info(
+                    "Scheduling status update for %s user %s %s",
+                    app["application_number"],
+                    app["chat_id"],
+                    app["last_updated"],
+                )
+                await self.rabbit.publish_message(message, routing_key="RefreshStatusQueue")
+
+        if not scheduled_count:
             logger.info("No applications need status refresh")
         else:
-            logger.info(f"{len(applications_to_update)} application(s) need status refresh")
-
-        for app in applications_to_update:
-            message = {
-                "chat_id": app["chat_id"],
-                "number": app["application_number"],
-                "suffix": app["application_suffix"],
-                "type": app["application_type"],
-                "year": app["application_year"],
-                "last_updated": app["last_updated"].isoformat() if app["last_updated"] else "0",
-            }
-            logger.info(f"Scheduling status update for {app['application_number']} user {app['chat_id']} {app['last_updated']}")
-            await self.rabbit.publish_message(message, routing_key="RefreshStatusQueue")
+            logger.info(f"{scheduled_count} application(s) need status refresh")
 
     def stop(self):
         self.shutdown_event.set()
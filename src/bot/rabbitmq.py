@@ -14,13 +14,12 @@ logger = logging.getLogger(__name__)
 
 
 class RabbitMQ:
-    def __init__(self, host, user, password, bot, db, loop):
+    def __init__(self, host, user, password, bot, db):
         self.host = host
         self.user = user
         self.password = password
         self.bot = bot
         self.db = db
-        self.loop = loop
         self.published_messages = set()
         self.connection = None
         self.channel = None
@@ -33,7 +32,6 @@ class RabbitMQ:
             try:
                 self.connection = await aio_pika.connect_robust(
                     f"amqp://{self.user}:{self.password}@{self.host}",
-                    loop=self.loop,
                 )
                 self.channel = await self.connection.channel()
                 self.queue = await self.channel.declare_queue("StatusUpdateQueue", durable=True)
@@ -85,13 +83,6 @@ class RabbitMQ:
             self.discard_message_id(unique_id)
 
             if chat_id and received_status:
-                # Fetch the current status from the database
-                current_status = await self.db.get_application_status(chat_id)
-
-                if current_status is None:
-                    logger.error(f"Failed to get current status from db for user {chat_id}")
-                    return
-
                 # FIXME olegeech: should be fixed on the fetcher side
                 # sometimes the fetcher returns a status for a different application
                 # with the one trailing number off
@@ -102,12 +93,18 @@ class RabbitMQ:
                     )
                     return
 
+                # Fetch the current status from the database, marking the application as checked
+                current_status = await self.db.touch_and_get_status(chat_id)
+
+                if current_status is None:
+                    logger.error(f"Failed to get current status from db for user {chat_id}")
+                    return
+
                 # check if it's force_refresh response
                 force_refresh = msg_data.get("force_refresh", False)
 
                 if current_status == received_status and not force_refresh:
                     logger.info(f"Status didn't change for user {chat_id} application")
-                    await self.db.update_timestamp(chat_id)
                     return
 
                 is_resolved = self.is_resolved(received_status)
@@ -117,9 +114,12 @@ class RabbitMQ:
                 else:
                     logger.info(f"Status of application has changed, notifying user {chat_id}")
 
-                # update application status in the DB
-                if await self.db.update_db_status(chat_id, received_status, is_resolved):
-                    lang = await self.db.get_user_language(chat_id)
+                # update application status in the DB, fetching the user language meanwhile
+                status_updated, lang = await asyncio.gather(
+                    self.db.update_db_status(chat_id, received_status, is_resolved),
+                    self.db.get_user_language(chat_id),
+                )
+                if status_updated:
                     # construct the notification text
                     if is_resolved:
                         notification_text = f"{message_texts[lang]['application_resolved']}\n\n{received_status}"